@@ -9,19 +9,59 @@ New fields:
   • standout_notes  – listener-highlight sentence (“Stand-out tracks …”)
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Dict
-import httpx, os, asyncio, re, html
-from urllib.parse import quote
+from contextlib import asynccontextmanager, nullcontext
+from collections import OrderedDict
+from async_lru import alru_cache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+import httpx, os, asyncio, re, hashlib, orjson, time
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+# ── shared outbound HTTP client (one connection pool per process) ──────
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    client = httpx.AsyncClient(
+        http2=True,                 # multiplex the gather() fan-out per host
+        limits=httpx.Limits(
+            max_connections=100,
+            max_keepalive_connections=20,
+            keepalive_expiry=60,    # keep idle upstream sockets warm between requests
+        ),
+        timeout=httpx.Timeout(15.0),
+        headers={"User-Agent": "penguin-jazz-guide/2.0"},
+    )
+    app.state.http = client
+    # shared profile cache across workers/restarts (optional)
+    app.state.redis = aioredis.from_url(
+        REDIS_URL,
+        socket_timeout=REDIS_TIMEOUT,           # a hung Redis must fall back to
+        socket_connect_timeout=REDIS_TIMEOUT,   # building, not stall /album
+    ) if REDIS_URL else None
+    try:
+        yield
+    finally:
+        await client.aclose()
+        if app.state.redis is not None:
+            await app.state.redis.aclose()
 
 # ── FastAPI app ─────────────────────────────────────────────────────────
 app = FastAPI(
     title="Jazz Album Profile",
     version="2.0.0",
     servers=[{"url": "https://jazz-api-oulu.onrender.com"}],   # ← your Render URL
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+# upstream still failing after retries: a gateway error, not "not found"
+@app.exception_handler(httpx.HTTPError)
+async def upstream_error(request: Request, exc: httpx.HTTPError):
+    return ORJSONResponse({"detail": "Upstream lookup failed"}, status_code=502)
+
 # ── response schema ────────────────────────────────────────────────────
 class Profile(BaseModel):
     artist: Dict[str, str]        # name, born, died, area
@@ -38,126 +78,321 @@ class Profile(BaseModel):
 MUSICBRAINZ = "https://musicbrainz.org/ws/2"
 DISCOGS     = "https://api.discogs.com"
 DC_TOKEN    = os.getenv("DISCOGS_TOKEN", "")
+REDIS_URL   = os.getenv("REDIS_URL", "")
+REDIS_TIMEOUT = 0.25          # seconds
+WORKERS     = int(os.getenv("WEB_CONCURRENCY", "1"))    # gunicorn reads this too
+
+# ── in-process cache (album metadata upstream almost never changes) ────
+CACHE_SIZE = 2048
+CACHE_TTL  = 86400            # seconds
+
+# ── MusicBrainz rate limit: 1 request / second / IP ────────────────────
+MB_INTERVAL = 1.0 * WORKERS   # per-worker spacing; all workers share one IP
+_mb_bucket  = asyncio.Semaphore(1)
+_mb_last    = 0.0
+
+@asynccontextmanager
+async def _mb_pace():
+    global _mb_last
+    async with _mb_bucket:
+        delta = time.monotonic() - _mb_last
+        if delta < MB_INTERVAL:
+            await asyncio.sleep(MB_INTERVAL - delta)
+        try:
+            yield
+        finally:
+            _mb_last = time.monotonic()
+
+# ── GET with retry on transient upstream failures ──────────────────────
+MAX_RETRY_AFTER = 5.0         # seconds we are willing to honour on a 429
+
+def _transient(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=0.1, max=1.0),
+    retry=retry_if_exception(_transient),
+    reraise=True,
+)
+async def _get(client: httpx.AsyncClient, url: str, **kw) -> httpx.Response:
+    # every attempt, retries included, queues for the MusicBrainz slot
+    async with _mb_pace() if url.startswith(MUSICBRAINZ) else nullcontext():
+        r = await client.get(url, **kw)
+    if r.status_code == 429:
+        try:
+            delay = float(r.headers.get("Retry-After", 1))
+        except ValueError:                  # HTTP-date form; just back off briefly
+            delay = 1.0
+        await asyncio.sleep(min(delay, MAX_RETRY_AFTER))
+    if r.status_code == 429 or r.status_code >= 500:
+        r.raise_for_status()
+    return r
+
+# ── conditional GET (ETag revalidation, skips re-parsing on 304) ───────
+ETAG_CACHE_SIZE = 4096
+_etag_cache: "OrderedDict[str, tuple[str, dict]]" = OrderedDict()
+
+def _etag_store(url: str, entry: tuple[str, dict]) -> None:
+    # (re-)insert as most recent; the entry may have been evicted while
+    # the request was in flight
+    _etag_cache[url] = entry
+    _etag_cache.move_to_end(url)
+    if len(_etag_cache) > ETAG_CACHE_SIZE:
+        _etag_cache.popitem(last=False)
+
+async def cget(client: httpx.AsyncClient, url: str, params: dict | None = None) -> dict:
+    if params:
+        url = str(httpx.URL(url).copy_merge_params(params))
+    cached = _etag_cache.get(url)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    # 5xx/429 that outlive the retries raise here, so the alru_cache'd
+    # helpers above never store an outage as a 24 h "not found"
+    r = await _get(client, url, headers=headers)
+    if r.status_code == 304 and cached:
+        _etag_store(url, cached)
+        return cached[1]
+    if r.status_code == 404:
+        return {}
+    r.raise_for_status()
+    data = orjson.loads(r.content)
+    etag = r.headers.get("ETag")
+    if etag:
+        _etag_store(url, (etag, data))
+    return data
 
 # ── helper: Cover Art Archive fallback ─────────────────────────────────
-async def cover_from_caa(release_group_id: str) -> str:
+@alru_cache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+async def cover_from_caa(client: httpx.AsyncClient, release_group_id: str) -> str:
     url = f"https://coverartarchive.org/release-group/{release_group_id}/front-500"
-    async with httpx.AsyncClient() as c:
-        r = await c.get(url, timeout=10)
+    r = await _get(client, url, timeout=10)   # outages raise, so they aren't cached
     return url if r.status_code == 200 else ""
 
-# ── helper: MusicBrainz full track list ────────────────────────────────
-async def mb_tracklist(release_id: str) -> List[str]:
-    url = f"{MUSICBRAINZ}/release/{release_id}?fmt=json&inc=media+recordings"
-    async with httpx.AsyncClient() as c:
-        data = (await c.get(url, timeout=15)).json()
-    tracks = []
-    for medium in data.get("media", []):
-        for t in medium.get("tracks", []):
-            tracks.append(f'{t["position"]}. {t["title"]}')
-    return tracks
-
-# ── helper: Wikipedia “recorded at …” sentence ─────────────────────────
-async def wiki_session(album: str, artist: str) -> str:
-    slug = quote(f"{album} ({artist} album)")
-    url  = f"https://en.wikipedia.org/api/rest_v1/page/summary/{slug}"
-    async with httpx.AsyncClient(
-        headers={"User-Agent": "penguin-jazz-guide/2.0"}
-    ) as c:
-        r = await c.get(url, timeout=10)
-    if r.status_code != 200:
-        return ""
-    text = r.json().get("extract", "")
-    for sent in text.split(". "):
-        if "recorded" in sent or "studio" in sent:
-            return sent.strip() + "."
+# ── helper: Wikipedia “recorded at …” + “stand-out tracks” sentences ──
+WIKI_API        = "https://en.wikipedia.org/w/api.php"
+_STANDOUT_WORDS = ("standout", "stand-out", "highlight", "notable")
+_WIKI_HEADING   = re.compile(r"^==.*==\s*$", re.M)
+
+def _first_sentence(paragraphs, words) -> str:
+    for para in paragraphs:
+        for sent in para.split(". "):
+            if any(w in sent for w in words):
+                return sent.strip().rstrip(".") + "."
     return ""
 
-# ── helper: quick “stand-out tracks” scrape (DuckDuckGo HTML) ──────────
-async def standout_from_web(album: str, artist: str) -> str:
-    q = quote(f'"{album}" "{artist}" review')
-    url = f"https://duckduckgo.com/html/?q={q}"
-    async with httpx.AsyncClient() as c:
-        page = (await c.get(url, timeout=10)).text
-    m = re.search(r'>([^<]{0,120}standout[^<]{0,120})<', page, re.I)
-    if not m:
-        return ""
-    return html.unescape(m.group(1)).strip()
+def _paragraphs(text: str) -> list[str]:
+    # one entry per paragraph, headings dropped, whitespace collapsed
+    return [
+        " ".join(line.split())
+        for line in text.splitlines()
+        if line.strip() and not _WIKI_HEADING.match(line)
+    ]
+
+@alru_cache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+async def wiki_session(client: httpx.AsyncClient, album: str, artist: str) -> tuple[str, str]:
+    # one TextExtracts call: whole article as plain text, no markup to strip
+    params = {
+        "action": "query",
+        "prop": "extracts",
+        "explaintext": 1,
+        "exsectionformat": "wiki",      # "== Reception ==" lines, easy to drop
+        "redirects": 1,
+        "titles": f"{album} ({artist} album)",
+        "format": "json",
+        "formatversion": 2,
+    }
+    pages = ((await cget(client, WIKI_API, params)).get("query") or {}).get("pages") or [{}]
+    text = pages[0].get("extract") or ""
+    if not text.strip():
+        return "", ""
+    heading = _WIKI_HEADING.search(text)
+    lead    = text[:heading.start()] if heading else text
+    return (
+        _first_sentence(_paragraphs(lead), ("recorded", "studio")),   # lead only
+        _first_sentence(_paragraphs(text), _STANDOUT_WORDS),
+    )
 
 # ── MusicBrainz basic calls ────────────────────────────────────────────
-async def mb_release(album: str, artist: str) -> dict:
+@alru_cache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+async def mb_release(client: httpx.AsyncClient, album: str, artist: str) -> dict:
     q   = f'release:"{album}" AND artist:"{artist}"'
-    url = f"{MUSICBRAINZ}/release/?query={q}&fmt=json&limit=1&inc=release-groups+labels"
-    async with httpx.AsyncClient() as c:
-        data = (await c.get(url, timeout=15)).json()
+    url = f"{MUSICBRAINZ}/release/?query={q}&fmt=json&limit=1"   # search ignores inc=
+    data = await cget(client, url)
     if not data.get("releases"):
         raise ValueError("No MB release")
     return data["releases"][0]
 
-async def mb_artist_dates(artist_id: str) -> dict:
+@alru_cache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+async def mb_release_lookup(client: httpx.AsyncClient, release_id: str) -> dict:
+    inc = "artist-credits+labels+release-groups+recordings"
+    return await cget(client, f"{MUSICBRAINZ}/release/{release_id}?fmt=json&inc={inc}")
+
+@alru_cache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+async def mb_artist_dates(client: httpx.AsyncClient, artist_id: str) -> dict:
     url = f"{MUSICBRAINZ}/artist/{artist_id}?fmt=json&inc=area"
-    async with httpx.AsyncClient() as c:
-        data = (await c.get(url, timeout=15)).json()
-    life = data.get("life-span", {})
+    data = await cget(client, url)
+    life = data.get("life-span") or {}
     return {
-        "born": life.get("begin", ""),
-        "died": life.get("end", ""),
-        "area": (data.get("area") or {}).get("name", ""),
+        "born": life.get("begin") or "",    # MB sends null, e.g. "end" for living artists
+        "died": life.get("end") or "",
+        "area": (data.get("area") or {}).get("name") or "",
     }
 
+# search → (full release lookup ‖ artist dates), as one chain that can run
+# alongside Discogs and Wikipedia, which don't depend on the MBID
+async def mb_release_full(client: httpx.AsyncClient, album: str, artist: str) -> tuple[dict, dict]:
+    try:
+        found = await mb_release(client, album, artist)
+    except ValueError:        # outages raise httpx errors → 502 below
+        raise HTTPException(404, "Album not found in MusicBrainz")
+    artist_id = found["artist-credit"][0]["artist"]["id"]
+    try:
+        async with asyncio.TaskGroup() as tg:
+            t_release = tg.create_task(mb_release_lookup(client, found["id"]))
+            t_artist  = tg.create_task(mb_artist_dates(client, artist_id))
+    except BaseExceptionGroup as eg:
+        raise eg.exceptions[0]
+    return t_release.result() or found, t_artist.result()
+
 # ── Discogs master data ────────────────────────────────────────────────
-async def discogs_master(album: str, artist: str) -> dict:
-    headers = {"User-Agent": "penguin-jazz-guide/2.0"}
+@alru_cache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+async def discogs_master(client: httpx.AsyncClient, album: str, artist: str) -> dict:
     params  = {
         "q": f"{album} {artist}",
         "type": "master",
         "per_page": 1,
         "token": DC_TOKEN,
     }
-    async with httpx.AsyncClient(headers=headers) as c:
-        search  = (await c.get(f"{DISCOGS}/database/search", params=params, timeout=15)).json()
-        master_id = search["results"][0]["id"]
-        master    = (await c.get(f"{DISCOGS}/masters/{master_id}", timeout=15)).json()
+    search = await cget(client, f"{DISCOGS}/database/search", params)
+    if not search.get("results"):
+        return {}             # not on Discogs: profile falls back to MB/CAA data
+    master_id = search["results"][0]["id"]
+    master    = await cget(client, f"{DISCOGS}/masters/{master_id}")
     return master
 
-# ── main endpoint ──────────────────────────────────────────────────────
-@app.get("/album", response_model=Profile)
-async def album(album: str, artist: str):
+# ── fail-soft wrapper for the nice-to-have fields ──────────────────────
+OPTIONAL_TIMEOUT = 3.0        # seconds; Wikipedia/CAA must not set the pace
+
+# returns (value, ok); ok=False means the default stood in for real data
+async def optional(coro, default) -> tuple:
     try:
-        mb_release_data = await mb_release(album, artist)
+        return await asyncio.wait_for(coro, OPTIONAL_TIMEOUT), True
+    except asyncio.CancelledError:
+        raise                 # never swallow cancellation
     except Exception:
-        raise HTTPException(404, "Album not found in MusicBrainz")
+        return default, False
+
+# ── Discogs credit line: "Name — role" ─────────────────────────────────
+def _credit(p: dict, default_role: str) -> str:
+    role = (p.get("role") or "").strip() or default_role
+    return f'{p["name"]} — {role}'
+
+# liner notes: newlines → spaces, CRs dropped, in one pass (after the 2000-char cut)
+_NL_TABLE = str.maketrans({"\n": " ", "\r": None})
+
+# ── main endpoint ──────────────────────────────────────────────────────
+# one in-flight build per album; concurrent identical requests share it
+_inflight: dict[tuple[str, str], asyncio.Future] = {}
+
+# let browsers / the CDN in front of Render answer repeat lookups; a
+# profile with a timed-out/failed optional field must not be kept anywhere
+CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=604800"
+NO_STORE      = "no-store"
 
-    # parallel tasks
-    artist_id  = mb_release_data["artist-credit"][0]["artist"]["id"]
-    tasks = await asyncio.gather(
-        mb_artist_dates(artist_id),
-        discogs_master(album, artist),
-        mb_tracklist(mb_release_data["id"]),
-        wiki_session(album, artist),
-        standout_from_web(album, artist),
+# If-None-Match may be a list, weak (W/"…", e.g. after CDN compression) or *
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    tags = (t.strip() for t in header.split(","))
+    return any(t == "*" or t.removeprefix("W/") == etag for t in tags)
+
+# response_model=None: profiles are built internally, so skip FastAPI's
+# output validation pass; the schema is still published for the docs
+@app.get("/album", response_model=None, responses={200: {"model": Profile}})
+async def album(request: Request, album: str, artist: str):
+    key = (album, artist)     # exact: the strings are echoed into the profile
+    fut = _inflight.get(key)
+    if fut is None:
+        fut = asyncio.ensure_future(_cached_profile(request.app.state, album, artist))
+        _inflight[key] = fut
+        fut.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: one client disconnecting must not cancel the others' build
+    profile, complete = await asyncio.shield(fut)
+
+    body = orjson.dumps(profile)
+    if not complete:
+        return Response(content=body, media_type="application/json",
+                        headers={"Cache-Control": NO_STORE})
+
+    # ETag from the body itself: a changed profile is never answered with 304
+    etag    = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Redis tier: one miss per cluster instead of one per worker; a Redis
+# outage just means building the profile again. Only complete profiles
+# are stored, so a degraded one is rebuilt on the next request.
+async def _cached_profile(state, album: str, artist: str) -> tuple[dict, bool]:
+    key = b"album:" + hashlib.sha1(f"{album}|{artist}".encode()).digest()
+    if state.redis is not None:
+        try:
+            cached = await state.redis.get(key)
+        except RedisError:
+            cached = None
+        if cached:
+            return orjson.loads(cached), True
+
+    profile, complete = await _build_profile(state.http, album, artist)
+    profile = profile.model_dump()
+    if complete and state.redis is not None:
+        try:
+            await state.redis.set(key, orjson.dumps(profile), ex=CACHE_TTL)
+        except RedisError:
+            pass
+    return profile, complete
+
+async def _build_profile(client: httpx.AsyncClient, album: str, artist: str) -> tuple[Profile, bool]:
+    # parallel tasks: the first critical failure cancels the siblings;
+    # optional ones degrade to "" and never fail the group
+    try:
+        async with asyncio.TaskGroup() as tg:
+            t_mb   = tg.create_task(mb_release_full(client, album, artist))
+            t_disc = tg.create_task(discogs_master(client, album, artist))
+            t_wiki = tg.create_task(optional(wiki_session(client, album, artist), ("", "")))
+    except BaseExceptionGroup as eg:
+        raise eg.exceptions[0]    # surface e.g. the 404 HTTPException as-is
+    (mb_release_data, artist_info), disc, ((session_info, standout), complete) = (
+        t.result() for t in (t_mb, t_disc, t_wiki)
     )
-    artist_info, disc, tracks, session_info, standout = tasks
+
+    # track list
+    tracks = [
+        f'{t["position"]}. {t["title"]}'
+        for medium in mb_release_data.get("media", [])
+        for t in medium.get("tracks", [])
+    ]
 
     # year (use first-release date)
     year = (
-        (mb_release_data.get("release-group") or {}).get("first-release-date", "")[:4]
-        or mb_release_data.get("date", "")[:4]
+        ((mb_release_data.get("release-group") or {}).get("first-release-date") or "")[:4]
+        or (mb_release_data.get("date") or "")[:4]
     )
 
     # catalogue number
     catno = ""
     if mb_release_data.get("label-info"):
-        catno = mb_release_data["label-info"][0].get("catalog-number", "")
+        catno = mb_release_data["label-info"][0].get("catalog-number") or ""
 
-    # personnel (main + sidemen)
-    personnel = [
-        f'{p["name"]} — {p.get("role","").strip() or "primary"}'
-        for p in disc.get("artists", [])
-    ] + [
-        f'{p["name"]} — {p.get("role","").strip()}'
-        for p in disc.get("extraartists", [])
-    ] or ["Personnel not listed"]
+    # personnel (main + sidemen, de-duplicated in credit order)
+    personnel = list(dict.fromkeys(
+        _credit(p, default_role)
+        for key, default_role in (("artists", "primary"), ("extraartists", ""))
+        for p in disc.get(key, ())
+    )) or ["Personnel not listed"]
 
     # cover art
     cover = next(
@@ -167,12 +402,13 @@ async def album(album: str, artist: str):
     if not cover:
         rg_id = (mb_release_data.get("release-group") or {}).get("id", "")
         if rg_id:
-            cover = await cover_from_caa(rg_id)
+            cover, cover_ok = await optional(cover_from_caa(client, rg_id), "")
+            complete = complete and cover_ok
 
     # Discogs liner-note excerpt
-    notes = " ".join(disc.get("notes", "").splitlines())[:2000]
+    notes = (disc.get("notes") or "")[:2000].translate(_NL_TABLE).rstrip()
 
-    return Profile(
+    profile = Profile.model_construct(
         artist={
             "name": artist,
             "born": artist_info["born"],
@@ -192,3 +428,16 @@ async def album(album: str, artist: str):
         session_info=session_info,
         standout_notes=standout,
     )
+    return profile, complete
+
+# ── local / container entry point (same stack as the gunicorn command) ─
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 8000)),
+        loop="uvloop",
+        http="httptools",
+        workers=WORKERS,
+    )
@@ -0,0 +1,248 @@
+"""
+/album driven end-to-end against mocked upstreams (httpx.MockTransport).
+
+Run:  pip install -r requirements-dev.txt && pytest -q
+"""
+
+import asyncio, time
+import httpx, pytest
+from tenacity import wait_none
+
+import main
+
+ALBUM = {"album": "Kind of Blue", "artist": "Miles Davis"}
+
+# ── fake upstreams ─────────────────────────────────────────────────────
+class Upstream:
+    """Canned MusicBrainz/Discogs/Wikipedia answers; `fail` overrides per host."""
+
+    def __init__(self):
+        self.calls: list[str] = []
+        self.fail: dict[str, list[httpx.Response]] = {}   # host → queued responses
+        self.delay = 0.0
+
+    async def __call__(self, req: httpx.Request) -> httpx.Response:
+        url, host = str(req.url), req.url.host
+        self.calls.append(url)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail.get(host):
+            return self.fail[host].pop(0)
+        if host == "musicbrainz.org":
+            if "query=" in url:
+                return httpx.Response(200, json={"releases": [
+                    {"id": "r1", "artist-credit": [{"artist": {"id": "a1"}}]}
+                ]})
+            if "/release/r1" in url:
+                return httpx.Response(200, json={
+                    "id": "r1",
+                    "release-group": {"id": "rg1", "first-release-date": "1959-08-17"},
+                    "label-info": [{"catalog-number": None}],
+                    "media": [{"tracks": [{"position": 1, "title": "So What"}]}],
+                })
+            return httpx.Response(200, json={"life-span": {"begin": "1926", "end": None}})
+        if host == "api.discogs.com":
+            if "search" in url:
+                return httpx.Response(200, json={"results": [{"id": 5}]})
+            return httpx.Response(200, json={
+                "artists": [{"name": "Miles Davis", "role": ""}],
+                "images": [{"type": "primary", "uri": "http://img/kob.jpg"}],
+                "notes": "Liner\r\nnotes\n",
+            })
+        if host == "en.wikipedia.org":
+            return httpx.Response(200, json={"query": {"pages": [{"extract":
+                "It was recorded at Columbia 30th Street Studio.\n\n"
+                "== Reception ==\nThe standout track is So What.\n"
+            }]}})
+        return httpx.Response(404)
+
+    def count(self, fragment: str) -> int:
+        return sum(fragment in u for u in self.calls)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data: dict[bytes, bytes] = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    # fresh process-level state for every test
+    for helper in (main.mb_release, main.mb_release_lookup, main.mb_artist_dates,
+                   main.discogs_master, main.wiki_session, main.cover_from_caa):
+        helper.cache_clear()
+    main._etag_cache.clear()
+    main._inflight.clear()
+    monkeypatch.setattr(main, "MB_INTERVAL", 0.0)
+    monkeypatch.setattr(main, "_mb_bucket", asyncio.Semaphore(1))
+    monkeypatch.setattr(main, "_mb_last", 0.0)
+    monkeypatch.setattr(main, "_get", main._get.retry_with(wait=wait_none()))
+
+    up = Upstream()
+    main.app.state.http = httpx.AsyncClient(transport=httpx.MockTransport(up))
+    main.app.state.redis = None
+    return up
+
+
+def api() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+
+
+async def get_album(**headers) -> httpx.Response:
+    async with api() as c:
+        return await c.get("/album", params=ALBUM, headers=headers)
+
+
+# ── profile ────────────────────────────────────────────────────────────
+def test_profile_fields(upstream):
+    r = asyncio.run(get_album())
+    assert r.status_code == 200
+    body = r.json()
+    assert body["artist"]["died"] == ""             # MB null coerced
+    assert body["album"] == {"title": "Kind of Blue", "year": "1959", "catalogue": ""}
+    assert body["tracks"] == ["1. So What"]
+    assert body["long_text"] == "Liner notes"
+    assert body["session_info"] == "It was recorded at Columbia 30th Street Studio."
+    assert body["standout_notes"] == "The standout track is So What."
+
+
+def test_unknown_album_is_404(upstream):
+    upstream.fail["musicbrainz.org"] = [httpx.Response(200, json={"releases": []})]
+    assert asyncio.run(get_album()).status_code == 404
+
+
+# ── retry / 429 / outages ──────────────────────────────────────────────
+def test_transient_5xx_is_retried(upstream):
+    upstream.fail["api.discogs.com"] = [httpx.Response(503), httpx.Response(502)]
+    r = asyncio.run(get_album())
+    assert r.status_code == 200
+    assert r.json()["personnel"] == ["Miles Davis — primary"]
+    assert upstream.count("discogs.com/database/search") == 3
+
+
+def test_429_waits_for_retry_after(upstream, monkeypatch):
+    monkeypatch.setattr(main, "MAX_RETRY_AFTER", 0.2)
+    upstream.fail["api.discogs.com"] = [httpx.Response(429, headers={"Retry-After": "30"})]
+    t = time.monotonic()
+    r = asyncio.run(get_album())
+    assert r.status_code == 200
+    assert 0.2 <= time.monotonic() - t < 5      # capped, not the full 30 s
+
+
+def test_persistent_outage_is_502_and_not_cached(upstream):
+    upstream.fail["musicbrainz.org"] = [httpx.Response(503)] * 3
+    r = asyncio.run(get_album())
+    assert r.status_code == 502
+    r = asyncio.run(get_album())                # upstream recovered
+    assert r.status_code == 200
+    assert r.json()["tracks"] == ["1. So What"]
+
+
+# ── MusicBrainz pacing ─────────────────────────────────────────────────
+def test_musicbrainz_requests_are_paced(upstream, monkeypatch):
+    monkeypatch.setattr(main, "MB_INTERVAL", 0.1)
+    client = main.app.state.http
+    mb, other = [], []
+
+    async def timed(url, log):
+        await main._get(client, url)
+        log.append(time.monotonic())
+
+    async def burst():
+        start = time.monotonic()
+        await asyncio.gather(
+            *(timed(f"{main.MUSICBRAINZ}/artist/a{i}", mb) for i in range(3)),
+            timed(f"{main.DISCOGS}/masters/5", other),
+        )
+        return start
+
+    start = asyncio.run(burst())
+    mb.sort()
+    assert all(b - a >= 0.09 for a, b in zip(mb, mb[1:]))
+    assert other[0] - start < 0.09              # other hosts don't queue behind MB
+
+
+# ── single-flight ──────────────────────────────────────────────────────
+def test_concurrent_identical_requests_share_one_build(upstream):
+    upstream.delay = 0.05
+
+    async def burst():
+        async with api() as c:
+            return await asyncio.gather(*(c.get("/album", params=ALBUM) for _ in range(5)))
+
+    responses = asyncio.run(burst())
+    assert {r.status_code for r in responses} == {200}
+    assert upstream.count("query=") == 1
+    assert main._inflight == {}
+
+
+def test_different_casing_is_not_coalesced(upstream):
+    upstream.delay = 0.05
+
+    async def burst():
+        async with api() as c:
+            return await asyncio.gather(
+                c.get("/album", params=ALBUM),
+                c.get("/album", params={**ALBUM, "album": "kind of blue"}),
+            )
+
+    a, b = asyncio.run(burst())
+    assert a.json()["album"]["title"] == "Kind of Blue"
+    assert b.json()["album"]["title"] == "kind of blue"
+
+
+def test_cancelled_caller_does_not_cancel_shared_build(upstream):
+    upstream.delay = 0.05
+
+    async def scenario():
+        async with api() as c:
+            first  = asyncio.create_task(c.get("/album", params=ALBUM))
+            second = asyncio.create_task(c.get("/album", params=ALBUM))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+    r = asyncio.run(scenario())
+    assert r.status_code == 200
+    assert r.json()["tracks"] == ["1. So What"]
+
+
+# ── complete vs degraded profiles: Redis + HTTP caching ────────────────
+def test_degraded_profile_is_no_store_and_not_shared(upstream):
+    redis = main.app.state.redis = FakeRedis()
+    upstream.fail["en.wikipedia.org"] = [httpx.Response(500)] * 3
+    r = asyncio.run(get_album())
+    assert r.status_code == 200
+    assert r.json()["session_info"] == ""
+    assert r.headers["cache-control"] == "no-store"
+    assert "etag" not in r.headers
+    assert redis.data == {}
+
+    r = asyncio.run(get_album())                # Wikipedia recovered
+    assert r.headers["cache-control"] == main.CACHE_CONTROL
+    assert r.json()["session_info"] != ""
+    assert len(redis.data) == 1
+
+
+def test_redis_hit_skips_upstreams(upstream):
+    main.app.state.redis = FakeRedis()
+    first = asyncio.run(get_album())
+    calls = len(upstream.calls)
+    again = asyncio.run(get_album())
+    assert again.json() == first.json()
+    assert len(upstream.calls) == calls
+
+
+def test_if_none_match_weak_or_listed_etag_is_304(upstream):
+    etag = asyncio.run(get_album()).headers["etag"]
+    for header in (etag, f"W/{etag}", f'"other", W/{etag}', "*"):
+        r = asyncio.run(get_album(**{"If-None-Match": header}))
+        assert r.status_code == 304, header
+        assert r.content == b""
+    assert asyncio.run(get_album(**{"If-None-Match": '"other"'})).status_code == 200